@@ -1,18 +1,56 @@
 # analysis.py
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 from pathlib import Path
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import hashlib
 import logging
-from typing import Tuple, Dict
+import multiprocessing
+import re
+from typing import Tuple, Dict, Iterator, List, Optional
 from models import BuildingManager
 import os
 
+try:
+    import numba
+except ImportError:  # optional: daily/weekly totals fall back to pandas resample
+    numba = None
+
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-def ingest_csv_folder(data_dir: str = "data") -> pd.DataFrame:
+# Bump whenever cleaning logic or output dtypes change, so old cache files are not served
+_CACHE_VERSION = 1
+
+# Common column-name variants (after strip + lower) and the standard name they map to
+COLUMN_ALIASES = {
+    "timestamp": "timestamp", "time": "timestamp", "date": "timestamp",
+    "kwh": "kWh", "kw": "kWh", "energy": "kWh",
+}
+
+def ingest_csv_folder(data_dir: str = "data", engine: str = "pyarrow",
+                      cache_dir: Optional[str] = None, workers: int = 1) -> pd.DataFrame:
     """
     Read all CSVs from data_dir, return a cleaned combined DataFrame with columns:
-    timestamp (datetime), kWh (float), Building (string)
+    timestamp (datetime), kWh (float32), Building (category)
+
+    engine: "pyarrow" parses each file with Arrow; "polars" builds one lazy scan
+    over all files and runs parse/cast/filter/sort in parallel (needs polars).
+
+    workers: with the pyarrow engine, workers > 1 parses files in that many forkserver
+    worker processes (worth it for large folders; scripts then need the usual
+    `if __name__ == "__main__":` guard). The default parses in-process.
+
+    cache_dir: if given, the cleaned result is cached there as Parquet, keyed by the
+    folder, the CSVs' names, sizes and modification times, and the engine, so unchanged
+    inputs skip CSV parsing entirely. Only the newest entry per folder/engine is kept.
     """
+    if engine not in ("pyarrow", "polars"):
+        raise ValueError(f"Unknown engine {engine!r}, expected 'pyarrow' or 'polars'.")
+
     data_dir = Path(data_dir)
     if not data_dir.exists():
         raise FileNotFoundError(f"Data directory {data_dir} does not exist.")
@@ -22,63 +60,279 @@ def ingest_csv_folder(data_dir: str = "data") -> pd.DataFrame:
         logging.warning("No CSV files found in data directory.")
         return pd.DataFrame(columns=["timestamp", "kWh", "Building"]).set_index("timestamp")
 
-    rows = []
+    cache_path = None
+    if cache_dir is not None:
+        # prefix identifies the folder + engine (for eviction), key the exact inputs
+        prefix = hashlib.sha1(repr((_CACHE_VERSION, str(data_dir.resolve()), engine)).encode()).hexdigest()[:16]
+        stats = sorted((f.name, f.stat().st_size, f.stat().st_mtime_ns) for f in files)
+        key = hashlib.sha1(repr((prefix, stats)).encode()).hexdigest()
+        cache_path = Path(cache_dir) / f"{prefix}-{key}.parquet"
+        if cache_path.exists():
+            try:
+                cached = pd.read_parquet(cache_path, engine="pyarrow")
+                logging.info(f"Loaded cached dataframe from {cache_path}")
+                return cached.set_index("timestamp")
+            except Exception as e:
+                logging.warning(f"Ignoring unreadable cache file {cache_path}: {e}")
+
+    if engine == "pyarrow":
+        combined, bad_files = _ingest_arrow(files, workers)
+    else:
+        combined, bad_files = _ingest_polars(files)
+
+    if combined is None:
+        logging.error("No valid data read from CSVs.")
+        return pd.DataFrame(columns=["timestamp", "kWh", "Building"]).set_index("timestamp")
+
+    combined = _compact_dtypes(combined)
+
+    if cache_path is not None:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        # write to a temp file and rename, so readers never see a half-written cache
+        tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+        combined.to_parquet(tmp_path, engine="pyarrow", compression="zstd", index=False)
+        os.replace(tmp_path, cache_path)
+        # evict entries for older versions of the same folder's inputs
+        for stale in cache_path.parent.glob(f"{prefix}-*.parquet"):
+            if stale != cache_path:
+                stale.unlink(missing_ok=True)
+
+    combined = combined.set_index("timestamp")
+    logging.info(f"Combined dataframe created with {len(combined)} rows from {len(files)} files.")
+    if bad_files:
+        logging.info(f"Files skipped or had errors: {bad_files}")
+    return combined
+
+def _ingest_arrow(files: List[Path], workers: int = 1) -> Tuple[Optional[pd.DataFrame], List[str]]:
+    """Parse files with Arrow (in worker processes if workers > 1); returns (timestamp-sorted frame or None, bad files)."""
+    if workers <= 1 or len(files) == 1:
+        parsed = [_parse_one(f) for f in files]
+    else:
+        # forkserver: never fork this (possibly multithreaded) process itself
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=multiprocessing.get_context("forkserver")) as ex:
+            parsed = list(ex.map(_parse_one, files))
+
+    tables = [t for t in parsed if t is not None]
+    bad_files = [str(f) for f, t in zip(files, parsed) if t is None]
+    if not tables:
+        return None, bad_files
+
+    # materialize a single DataFrame from all files at once; files whose columns
+    # Arrow couldn't type (raw strings) don't share a schema and go through pd.concat
+    if all(t.schema.equals(tables[0].schema) for t in tables):
+        combined = pa.concat_tables(tables).to_pandas()
+    else:
+        combined = pd.concat([t.to_pandas() for t in tables], ignore_index=True)
+    combined = _coerce_types(combined)
+    # files are usually time-ordered already; a stable (timsort) sort merges those runs
+    if not combined["timestamp"].is_monotonic_increasing:
+        combined = combined.sort_values("timestamp", kind="stable")
+    return combined, bad_files
+
+def _standard_header(f: Path) -> Optional[List[str]]:
+    """Return the standard columns in f's header if it has timestamp and kWh as-is, else None."""
+    try:
+        with open(f, newline="") as fh:
+            header = next(csv.reader(fh), [])
+    except (OSError, UnicodeDecodeError):
+        # unreadable here; the generic path reports it and skips the file
+        return None
+    if "timestamp" not in header or "kWh" not in header:
+        return None
+    return [c for c in ("timestamp", "kWh", "Building") if c in header]
+
+def _parse_one(f: Path) -> Optional[pa.Table]:
+    """
+    Parse a single CSV into an Arrow table with columns timestamp, kWh, Building.
+    Returns None (after logging why) for files that can't be used.
+    Module-level so it can be pickled into ProcessPoolExecutor workers.
+
+    Files whose header already uses the standard column names are read with fixed
+    types (no type inference, no renaming); if values don't parse, the file goes
+    through the generic path instead.
+    """
+    try:
+        table = None
+        known_columns = _standard_header(f)
+        if known_columns is not None:
+            try:
+                table = pacsv.read_csv(f, convert_options=pacsv.ConvertOptions(
+                    column_types={"timestamp": pa.timestamp("ns"), "kWh": pa.float64()},
+                    include_columns=known_columns, strings_can_be_null=True))
+            except (pa.ArrowInvalid, pa.ArrowKeyError):
+                table = None
+
+        if table is None:
+            # Arrow's multithreaded C parser infers typed columns directly
+            table = pacsv.read_csv(f, convert_options=pacsv.ConvertOptions(strings_can_be_null=True))
+            table = table.rename_columns(_standardize_columns(table.column_names))
+
+            # require timestamp + kWh
+            if "timestamp" not in table.column_names or "kWh" not in table.column_names:
+                logging.warning(f"Skipping {f} — missing required columns. Columns: {table.column_names}")
+                return None
+
+        # infer building name if not present
+        building_name = None
+        if "Building" in table.column_names:
+            building_name = table["Building"][0].as_py()
+        else:
+            # use filename
+            building_name = f.stem
+
+        # typed in C by Arrow where possible; a dirty kWh column stays raw for _coerce_types
+        return pa.table({
+            "timestamp": _parse_timestamps(table["timestamp"]),
+            "kWh": _try_cast(table["kWh"], pa.float64()),
+            # dictionary-encoded: one string plus an int8 code per row (categorical in pandas)
+            "Building": pa.DictionaryArray.from_arrays(
+                np.zeros(table.num_rows, dtype=np.int8), pa.array([str(building_name)], pa.string())),
+        })
+    except Exception as e:
+        logging.exception(f"Failed to read {f}: {e}")
+        return None
+
+def _ingest_polars(files: List[Path]) -> Tuple[Optional[pd.DataFrame], List[str]]:
+    """Build one lazy Polars plan over all files; returns (timestamp-sorted frame or None, bad files)."""
+    import polars as pl  # optional dependency, only needed for engine="polars"
+
+    lazy_frames = []
     bad_files = []
     for f in files:
         try:
-            # try to read robustly: treat bad lines as NaN then drop them
-            df = pd.read_csv(f)
-            # infer building name if not present
-            building_name = None
-            if "Building" in df.columns:
-                building_name = df["Building"].iloc[0]
-            else:
-                # use filename
-                building_name = f.stem
-
-            # Standardize column names (common variants)
-            col_map = {}
-            for c in df.columns:
-                lc = c.strip().lower()
-                if lc in ("timestamp", "time", "date"):
-                    col_map[c] = "timestamp"
-                if lc in ("kwh", "kw", "energy"):
-                    col_map[c] = "kWh"
-            df = df.rename(columns=col_map)
+            # read everything as strings, casting is done in the plan below
+            lf = pl.scan_csv(f, infer_schema=False)
+            names = lf.collect_schema().names()
+
+            col_map = dict(zip(names, _standardize_columns(names)))
 
             # require timestamp + kWh
-            if "timestamp" not in df.columns or "kWh" not in df.columns:
-                logging.warning(f"Skipping {f} — missing required columns. Columns: {df.columns.tolist()}")
+            if "timestamp" not in col_map.values() or "kWh" not in col_map.values():
+                logging.warning(f"Skipping {f} — missing required columns. Columns: {names}")
                 bad_files.append(str(f))
                 continue
 
-            df["Building"] = building_name
-            # parse timestamps
-            df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
-            # parse kWh to numeric (coerce errors)
-            df["kWh"] = pd.to_numeric(df["kWh"], errors="coerce")
-            # drop rows with NaT or NaN
-            df = df.dropna(subset=["timestamp", "kWh"])
-
-            rows.append(df[["timestamp", "kWh", "Building"]])
+            # infer building name if not present, otherwise use filename
+            building = pl.col("Building").first() if "Building" in names else pl.lit(f.stem)
+            lazy_frames.append(
+                lf.rename(col_map)
+                .select(
+                    pl.col("timestamp").str.to_datetime(time_unit="ns", strict=False),
+                    pl.col("kWh").cast(pl.Float64, strict=False).fill_nan(None),
+                    building.cast(pl.String).alias("Building"),
+                )
+                .drop_nulls(["timestamp", "kWh"])
+            )
         except Exception as e:
             logging.exception(f"Failed to read {f}: {e}")
             bad_files.append(str(f))
 
-    if not rows:
-        logging.error("No valid data read from CSVs.")
-        return pd.DataFrame(columns=["timestamp", "kWh", "Building"]).set_index("timestamp")
+    if not lazy_frames:
+        return None, bad_files
 
-    combined = pd.concat(rows, ignore_index=True)
-    combined["timestamp"] = pd.to_datetime(combined["timestamp"])
-    combined = combined.sort_values("timestamp")
-    combined = combined.set_index("timestamp")
-    logging.info(f"Combined dataframe created with {len(combined)} rows from {len(files)} files.")
-    if bad_files:
-        logging.info(f"Files skipped or had errors: {bad_files}")
-    return combined
+    combined = pl.concat(lazy_frames).sort("timestamp").collect(engine="streaming")
+    return combined.to_pandas(), bad_files
+
+def _standardize_columns(columns: List[str]) -> List[str]:
+    """Rename common column variants to timestamp / kWh, leaving other columns unchanged."""
+    normalized = pd.Index(columns).str.strip().str.lower()
+    return [COLUMN_ALIASES.get(n, orig) for n, orig in zip(normalized, columns)]
+
+def _try_cast(column: pa.ChunkedArray, target: pa.DataType) -> pa.ChunkedArray:
+    """
+    Cast an Arrow column to target type. If Arrow refuses the cast (dirty values),
+    return it as strings so pandas can coerce it later in one bulk pass.
+    """
+    if column.type == target:
+        return column
+    try:
+        return column.cast(target)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        return column.cast(pa.string())
+
+def _parse_timestamps(column: pa.ChunkedArray) -> pa.ChunkedArray:
+    """
+    Cast a file's timestamp column to timestamp[ns]. Dirty columns are parsed by pandas
+    per file, since pandas infers one date format per call and files can differ.
+    """
+    column = _try_cast(column, pa.timestamp("ns"))
+    if column.type == pa.string():
+        parsed = pd.to_datetime(column.to_pandas(), errors="coerce")
+        column = pa.chunked_array([pa.array(parsed, type=pa.timestamp("ns"), from_pandas=True)])
+    return column
+
+def _coerce_types(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Parse whatever kWh values are still raw with one vectorized call (unparseable
+    values become NaN), then drop rows missing a timestamp or kWh.
+    """
+    if df["kWh"].dtype.kind != "f":
+        df["kWh"] = pd.to_numeric(df["kWh"], errors="coerce")
+    return df.dropna(subset=["timestamp", "kWh"])
+
+def _compact_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Half-width kWh floats and Building as category codes instead of strings."""
+    df["kWh"] = df["kWh"].astype("float32")
+    df["Building"] = df["Building"].astype("category")
+    return df
+
+def iter_csv_folder(data_dir: str = "data") -> Iterator[pd.DataFrame]:
+    """
+    Yield one cleaned DataFrame per CSV in data_dir (same layout as ingest_csv_folder),
+    so callers can process inputs larger than memory one file at a time.
+    Files that can't be used are logged and skipped.
+    """
+    data_dir = Path(data_dir)
+    if not data_dir.exists():
+        raise FileNotFoundError(f"Data directory {data_dir} does not exist.")
+
+    for f in data_dir.glob("*.csv"):
+        table = _parse_one(f)
+        if table is None:
+            continue
+        df = _compact_dtypes(_coerce_types(table.to_pandas()))
+        if not df["timestamp"].is_monotonic_increasing:
+            df = df.sort_values("timestamp", kind="stable")
+        yield df.set_index("timestamp")
 
 # Aggregation functions
+_NS_PER_DAY = 86_400_000_000_000
+
+def _bin_sum(bins: np.ndarray, values: np.ndarray, n_bins: int) -> np.ndarray:
+    """Add each non-NaN value into its bin; bins must be in range(n_bins)."""
+    out = np.zeros(n_bins)
+    for i in range(bins.shape[0]):
+        if values[i] == values[i]:  # skip NaN, like resample().sum()
+            out[bins[i]] += values[i]
+    return out
+
+if numba is not None:
+    _bin_sum = numba.njit(cache=True)(_bin_sum)
+
+def _resample_sum(df: pd.DataFrame, freq: str) -> pd.Series:
+    """
+    Equivalent of df.resample(freq)["kWh"].sum() for freq "D" or "W".
+    On a sorted, tz-naive DatetimeIndex the bins are computed from day ordinals and
+    summed by a numba kernel in one pass; anything else goes through pandas resample.
+    """
+    index = df.index
+    if (numba is None or not isinstance(index, pd.DatetimeIndex) or index.tz is not None
+            or not index.is_monotonic_increasing):
+        # sum in float64 like the kernel; pandas keeps float32 sums in float32
+        return df["kWh"].astype("float64").resample(freq).sum()
+
+    days = index.as_unit("ns").asi8 // _NS_PER_DAY
+    step = 1
+    if freq == "W":
+        # move each day to the Sunday that ends its week (1970-01-01 was a Thursday)
+        days = days + (3 - days) % 7
+        step = 7
+    bins = (days - days[0]) // step
+    sums = _bin_sum(bins, df["kWh"].to_numpy(dtype=np.float64), int(bins[-1]) + 1)
+    start = pd.Timestamp(int(days[0]) * _NS_PER_DAY)
+    return pd.Series(sums, index=pd.date_range(start, periods=len(sums), freq=freq), name="kWh")
+
 def calculate_daily_totals(df: pd.DataFrame) -> pd.DataFrame:
     """
     df: DataFrame indexed by timestamp with column 'kWh' and optional 'Building' column.
@@ -86,7 +340,7 @@ def calculate_daily_totals(df: pd.DataFrame) -> pd.DataFrame:
     """
     if df.empty:
         return pd.DataFrame(columns=["kWh"])
-    daily = df.resample("D")["kWh"].sum().to_frame()
+    daily = _resample_sum(df, "D").to_frame()
     daily.index.name = "date"
     daily = daily.rename(columns={"kWh": "daily_kWh"})
     return daily
@@ -94,38 +348,93 @@ def calculate_daily_totals(df: pd.DataFrame) -> pd.DataFrame:
 def calculate_weekly_aggregates(df: pd.DataFrame) -> pd.DataFrame:
     if df.empty:
         return pd.DataFrame(columns=["kWh"])
-    weekly = df.resample("W")["kWh"].sum().to_frame()
+    weekly = _resample_sum(df, "W").to_frame()
     weekly.index.name = "week_end"
     weekly = weekly.rename(columns={"kWh": "weekly_kWh"})
     return weekly
 
-def building_wise_summary(df: pd.DataFrame) -> pd.DataFrame:
+_NUMBA_ENGINE_KWARGS = {"nopython": True, "parallel": True, "nogil": True}
+
+def building_wise_summary(df: pd.DataFrame, engine: str = "cython") -> pd.DataFrame:
+    """
+    Per-building mean/min/max/total kWh.
+    engine="numba" runs the reductions in parallel across groups through pandas' numba
+    groupby engine (needs numba); it only pays off for many buildings, as each
+    reduction is JIT-compiled per process.
+    """
+    if engine not in ("cython", "numba"):
+        raise ValueError(f"Unknown engine {engine!r}, expected 'cython' or 'numba'.")
     if df.empty or "Building" not in df.columns:
         return pd.DataFrame(columns=["mean","min","max","sum"])
-    grouped = df.reset_index().groupby("Building")["kWh"].agg(['mean','min','max','sum']).round(3)
+    # kWh is stored as float32 but pandas sums float32 in float32; aggregate in float64
+    by_building = df["kWh"].astype("float64").groupby(df["Building"], observed=True)
+    if engine == "numba":
+        grouped = pd.DataFrame({
+            stat: getattr(by_building, stat)(engine="numba", engine_kwargs=_NUMBA_ENGINE_KWARGS)
+            for stat in ('mean','min','max','sum')
+        })
+    else:
+        grouped = by_building.agg(['mean','min','max','sum'])
+    grouped = grouped.round(3)
     grouped = grouped.rename(columns={"mean":"mean_kWh","min":"min_kWh","max":"max_kWh","sum":"total_kWh"})
     return grouped
 
+def summarize_csv_folder(data_dir: str = "data") -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Streaming equivalent of calculate_daily_totals + building_wise_summary.
+    Files are aggregated one at a time via iter_csv_folder, so only per-day and
+    per-building running totals stay in memory instead of every reading.
+    Returns (daily totals, building summary).
+    """
+    daily_accum = defaultdict(float)
+    building_stats = {}  # Building -> [count, sum, min, max]
+    for df in iter_csv_folder(data_dir):
+        for day, total in _resample_sum(df, "D").items():
+            daily_accum[day] += total
+        stats = df["kWh"].astype("float64").groupby(df["Building"], observed=True).agg(['count','sum','min','max'])
+        for b, count, total, lo, hi in stats.itertuples():
+            if b in building_stats:
+                acc = building_stats[b]
+                acc[0] += count
+                acc[1] += total
+                acc[2] = min(acc[2], lo)
+                acc[3] = max(acc[3], hi)
+            else:
+                building_stats[b] = [count, total, lo, hi]
+
+    if not daily_accum:
+        return pd.DataFrame(columns=["kWh"]), pd.DataFrame(columns=["mean","min","max","sum"])
+
+    # days without readings in any file still get a 0 total, as with resample
+    daily = pd.Series(daily_accum).sort_index().asfreq("D", fill_value=0.0).to_frame("daily_kWh")
+    daily.index.name = "date"
+
+    summary = pd.DataFrame.from_dict(building_stats, orient="index", columns=["count","sum","min","max"])
+    summary = pd.DataFrame({
+        "mean_kWh": summary["sum"] / summary["count"],
+        "min_kWh": summary["min"],
+        "max_kWh": summary["max"],
+        "total_kWh": summary["sum"],
+    }).round(3).sort_index()
+    summary.index.name = "Building"
+    return daily, summary
+
 def find_peak_time(df: pd.DataFrame) -> pd.Series:
     """Return timestamp with maximum single kWh reading."""
     if df.empty:
         return pd.Series()
 
-    # Find index of maximum kWh
-    idx = df["kWh"].idxmax()
-
-    # Extract the FIRST value even if multiple rows share the timestamp
-    kwh_series = df.loc[idx, "kWh"]
+    values = df["kWh"].to_numpy()
+    if np.isnan(values).all():
+        return pd.Series()
 
-    # If multiple values → take first
-    if hasattr(kwh_series, "__iter__"):
-        peak_value = float(kwh_series.iloc[0])
-    else:
-        peak_value = float(kwh_series)
+    # positional argmax (NaN skipped, like idxmax): no label lookup on a possibly non-unique DatetimeIndex
+    i = np.nanargmax(values)
 
     return pd.Series({
-        "timestamp": idx,
-        "kWh": peak_value
+        "timestamp": df.index[i],
+        # via str: a float32 reading widens to its shortest repr, not 99.99967956542969
+        "kWh": float(str(values[i]))
     })
 
 
@@ -135,7 +444,33 @@ def export_csvs(cleaned_df: pd.DataFrame, summary_df: pd.DataFrame, output_dir:
     out.mkdir(exist_ok=True)
     cleaned_path = out / "cleaned_energy_data.csv"
     summary_path = out / "building_summary.csv"
-    cleaned_df.reset_index().to_csv(cleaned_path, index=False)
+    # the cleaned frame is large: format it with Arrow's multithreaded C writer.
+    # Unlike pandas, integral floats come out as "67" rather than "67.0".
+    special = r'[",\r\n]'
+    table = pa.Table.from_pandas(cleaned_df.reset_index(), preserve_index=False)
+    # quote nothing unless a header or string value needs it; Arrow's "needed" style then
+    # quotes every string (still valid CSV). Only header names and the categorical's few
+    # unique values are checked, never every row.
+    needs_quotes = any(re.search(special, name) for name in table.column_names)
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            column = table.column(i)
+            needs_quotes = needs_quotes or any(
+                re.search(special, str(value)) for chunk in column.chunks for value in chunk.dictionary.to_pylist())
+            # categorical Building -> plain strings for the CSV writer
+            table = table.set_column(i, field.name, column.cast(field.type.value_type))
+        elif pa.types.is_string(field.type) or pa.types.is_large_string(field.type):
+            # plain string column: don't scan every row, just allow quoting
+            needs_quotes = True
+        elif pa.types.is_timestamp(field.type):
+            # write whole-second readings without a trailing .000000000 (safe cast fails otherwise)
+            try:
+                table = table.set_column(i, field.name, table.column(i).cast(pa.timestamp("s")))
+            except pa.ArrowInvalid:
+                pass
+    style = "needed" if needs_quotes else "none"
+    pacsv.write_csv(table, cleaned_path, pacsv.WriteOptions(quoting_style=style, quoting_header=style))
+    # summary is one row per building, pandas is fine
     summary_df.to_csv(summary_path)
     return str(cleaned_path), str(summary_path)
 
@@ -1,17 +1,25 @@
 # visualization.py
+import matplotlib
+matplotlib.use("Agg")  # render straight to file, no GUI backend
 import matplotlib.pyplot as plt
+from matplotlib.lines import Line2D
 import pandas as pd
 from pathlib import Path
 import logging
+from typing import Optional, Union
 
 logging.basicConfig(level=logging.INFO)
 
-def create_dashboard(cleaned_df: pd.DataFrame, output_path: str = "output/dashboard.png"):
+def create_dashboard(cleaned_df: pd.DataFrame, output_path: str = "output/dashboard.png",
+                     daily: Optional[Union[pd.Series, pd.DataFrame]] = None):
     """
     Create a 3-chart dashboard:
      - Trend line (daily totals)
      - Bar chart (average weekly usage by building)
      - Scatter plot (peak hourly consumption points)
+
+    daily: precomputed daily totals (e.g. from calculate_daily_totals) so a pipeline
+    that already has them doesn't resample the data a second time.
     """
     outp = Path(output_path)
     outp.parent.mkdir(parents=True, exist_ok=True)
@@ -21,17 +29,20 @@ def create_dashboard(cleaned_df: pd.DataFrame, output_path: str = "output/dashbo
         return
 
     # Daily totals
-    daily = cleaned_df.resample("D")["kWh"].sum()
+    if daily is None:
+        daily = cleaned_df.resample("D")["kWh"].sum()
+    elif isinstance(daily, pd.DataFrame):
+        daily = daily.iloc[:, 0]
 
     # Weekly avg per building: group by Building & week
     if "Building" in cleaned_df.columns:
-        weekly_by_building = cleaned_df.reset_index().set_index("timestamp").groupby("Building")["kWh"].resample("W").mean().reset_index()
-        avg_weekly = weekly_by_building.groupby("Building")["kWh"].mean().sort_values(ascending=False)
+        weekly_by_building = cleaned_df.groupby(["Building", pd.Grouper(freq="W")], observed=True)["kWh"].mean()
+        avg_weekly = weekly_by_building.groupby(level="Building", observed=True).mean().sort_values(ascending=False)
     else:
         avg_weekly = pd.Series(dtype=float)
 
     # Peak hourly points (top 100)
-    top_points = cleaned_df.sort_values("kWh", ascending=False).head(100).reset_index()
+    top_points = cleaned_df.nlargest(100, "kWh").reset_index()
 
     # create figure
     fig, axes = plt.subplots(3, 1, figsize=(12, 14), constrained_layout=True)
@@ -53,20 +64,22 @@ def create_dashboard(cleaned_df: pd.DataFrame, output_path: str = "output/dashbo
 
     # 3) Scatter - peak hourly consumption (kWh vs timestamp), color by building if present
     if "Building" in top_points.columns:
-        buildings = top_points["Building"].unique()
-        for b in buildings:
-            subset = top_points[top_points["Building"] == b]
-            axes[2].scatter(subset["timestamp"], subset["kWh"], label=b, s=20)
-        axes[2].legend()
+        # one scatter call for all buildings; tab20 is a 20-colour listed map, index it by code
+        codes, buildings = pd.factorize(top_points["Building"])
+        axes[2].scatter(top_points["timestamp"], top_points["kWh"], c=plt.cm.tab20(codes % 20), s=20,
+                        rasterized=True)
+        handles = [Line2D([0], [0], marker="o", linestyle="", color=plt.cm.tab20(i % 20), label=str(b))
+                   for i, b in enumerate(buildings)]
+        axes[2].legend(handles=handles)
     else:
-        axes[2].scatter(top_points["timestamp"], top_points["kWh"], s=20)
+        axes[2].scatter(top_points["timestamp"], top_points["kWh"], s=20, rasterized=True)
     axes[2].set_title("Top Consumption Readings (Peak hours)")
     axes[2].set_xlabel("Timestamp")
     axes[2].set_ylabel("kWh (single reading)")
     axes[2].grid(True)
 
     plt.suptitle("Campus Energy Dashboard", fontsize=16)
-    plt.savefig(outp, dpi=150)
+    plt.savefig(outp, dpi=150, bbox_inches="tight")
     logging.info(f"Dashboard saved to {outp}")
     plt.close(fig)
     return str(outp)
\ No newline at end of file